@@ -0,0 +1,181 @@
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from types import SimpleNamespace
+from utils.game import CustomBoard, GameManager, Games, RandomBoard, ReverseBoard
+
+
+CUSTOM_LEVEL = """```
+- moves: 60
+empty empty empty empty empty empty empty empty
+empty box empty empty box empty empty empty
+empty empty player goal empty empty wall empty
+empty goal empty empty box empty empty empty
+empty empty box empty goal goal empty empty
+empty empty empty empty empty empty empty empty
+```"""
+XSB_LEVEL = """- moves: 60
+##########
+#        #
+# $  $   #
+#  @.  # #
+# .  $   #
+#  $ .. ##
+##########"""
+ENEMY_LEVEL = "\n".join(" ".join("enemy" if (row * 3 + col) % 11 == 0 else "empty" for col in range(12))
+                        for row in range(10)).replace("empty", "player", 1).replace("empty", "box", 1) \
+    .replace("empty", "goal", 1)
+
+
+def cycle(game, moves="LURDRDLU"):
+    state = {"idx": 0}
+
+    def op():
+        result = game.move(moves[state["idx"] & 7])
+        state["idx"] += 1
+        if result["win"]:
+            game.reset()
+    return op
+
+
+def bench_move(seed):
+    game = GameManager("1", None, content=CUSTOM_LEVEL, seed=seed)
+    game.moves = None
+    return cycle(game)
+
+
+def bench_move_enemies(seed, chase=0):
+    game = GameManager("1", None, content=ENEMY_LEVEL, seed=seed)
+    game.chase = chase
+    return cycle(game)
+
+
+def bench_check_for_win(seed):
+    game = GameManager("30", None, seed=seed)
+    return game.check_for_win
+
+
+def bench_random_board(seed, level):
+    rng = random.Random(seed)
+    return lambda: RandomBoard(5, 5, level, level, rng=rng)
+
+
+def bench_reverse_board(seed, level):
+    rng = random.Random(seed)
+    return lambda: ReverseBoard(5, 5, level, level, rng=rng)
+
+
+def bench_custom_board(seed, level):
+    def op():
+        board = CustomBoard(board=level)
+        board.check_for_validity()
+    return op
+
+
+def bench_format_board(seed, full):
+    games = Games()
+    user = SimpleNamespace(id=1, name="bench")
+    channel = SimpleNamespace(id=2, name="bench")
+    games.new(user, channel, None, level_id="60", seed=seed)
+    game = games.get_game(user.id)
+    move = cycle(game)
+
+    def op():
+        move()
+        if full:
+            game.dirty = None
+        games.format_board(user.id)
+    return op
+
+
+def suite(seed):
+    benches = {
+        "move": bench_move(seed),
+        "move_enemies": bench_move_enemies(seed),
+        "move_enemies_chase": bench_move_enemies(seed, 50),
+        "check_for_win": bench_check_for_win(seed),
+        "custom_board": bench_custom_board(seed, CUSTOM_LEVEL),
+        "custom_board_xsb": bench_custom_board(seed, XSB_LEVEL),
+        "format_board_full": bench_format_board(seed, True),
+        "format_board_dirty": bench_format_board(seed, False),
+    }
+    for level in (1, 10, 50, 100):
+        benches[f"random_board_{level}"] = bench_random_board(seed, level)
+        benches[f"reverse_board_{level}"] = bench_reverse_board(seed, level)
+    return benches
+
+
+def measure(op, duration, samples):
+    op()
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        for _ in range(16):
+            op()
+        count += 16
+    ops = count / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    allocated = 0
+    blocks = sys.getallocatedblocks()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        op()
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return {"ops": ops, "alloc": allocated / samples, "retained": blocks / samples}
+
+
+def compare(results, baseline, tolerance):
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ops = result["ops"] / baseline[name]["ops"] - 1
+        alloc = (result["alloc"] + 1) / (baseline[name]["alloc"] + 1) - 1
+        print(f"{name:<22} ops {ops:+7.1%}  alloc {alloc:+7.1%}")
+        if ops < -tolerance or alloc > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the game engine hot paths")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=0.5)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--only", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", default=None, help="write results to this baseline file")
+    parser.add_argument("--compare", default=None, help="compare results against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = dict()
+    for name, op in suite(args.seed).items():
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(op, args.duration, args.samples)
+        result = results[name]
+        print(f"{name:<22} {result['ops']:>12,.0f} ops/s {result['alloc']:>10,.0f} B/op {result['retained']:>8.2f} blocks/op")
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as fp:
+            regressions = compare(results, json.load(fp), args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
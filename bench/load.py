@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from types import SimpleNamespace
+from utils.metrics import Metrics
+from utils.watchdog import LoopWatchdog
+
+
+CUSTOM_LEVEL = """empty empty empty empty empty empty
+empty box empty empty box empty
+empty empty player goal empty empty
+empty goal empty empty box empty
+empty empty box empty goal goal"""
+ARROWS = ("⬅️", "⬆️", "➡️", "⬇️")
+
+
+class Gateway:
+    def __init__(self, latency, jitter):
+        self.latency = latency
+        self.jitter = jitter
+        self.ids = itertools.count(1000)
+        self.calls = {"send": 0, "edit": 0, "add_reaction": 0, "clear_reactions": 0}
+
+    async def call(self, kind):
+        self.calls[kind] += 1
+        await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+    def total(self):
+        return sum(self.calls.values())
+
+
+class StubMessage:
+    def __init__(self, gateway, channel, embed=None, content=None):
+        self.gateway = gateway
+        self.id = next(gateway.ids)
+        self.channel = channel
+        self.embed = embed
+        self.content = content
+        self.attachments = list()
+        self.reactions = list()
+
+    async def edit(self, embed=None, content=None, **kwargs):
+        await self.gateway.call("edit")
+        self.embed = embed or self.embed
+        self.content = content or self.content
+
+    async def add_reaction(self, emoji):
+        await self.gateway.call("add_reaction")
+        self.reactions.append(emoji)
+
+    async def clear_reactions(self):
+        await self.gateway.call("clear_reactions")
+        self.reactions.clear()
+
+
+class StubChannel:
+    def __init__(self, gateway, channel_id):
+        self.gateway = gateway
+        self.id = channel_id
+        self.messages = list()
+
+    async def send(self, content=None, embed=None, **kwargs):
+        await self.gateway.call("send")
+        message = StubMessage(self.gateway, self, embed=embed, content=content)
+        self.messages.append(message)
+        return message
+
+
+class StubContext:
+    def __init__(self, author, channel):
+        self.author = author
+        self.channel = channel
+        self.message = StubMessage(channel.gateway, channel)
+        self.guild = None
+
+    async def send(self, content=None, embed=None, **kwargs):
+        return await self.channel.send(content=content, embed=embed, **kwargs)
+
+
+class StubBot:
+    def __init__(self, loop):
+        self.loop = loop
+        self.user = SimpleNamespace(id=0, name="bot")
+        self.logger = logging.getLogger("load")
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+        self.metrics = Metrics()
+
+    async def wait_for(self, event, check=None, timeout=None):
+        raise asyncio.TimeoutError
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def player(cog, gateway, user, channel, kind, moves, think, latencies):
+    ctx = StubContext(user, channel)
+    start = time.perf_counter()
+    if kind == "custom":
+        await cog.text.callback(cog, ctx, text=CUSTOM_LEVEL)
+    elif kind == "challenge":
+        await cog.challenge.callback(cog, ctx, None, "5")
+    else:
+        await cog.infinite.callback(cog, ctx, None, "5")
+    latencies["command"].append(time.perf_counter() - start)
+    applied = 0
+    for _ in range(moves):
+        await asyncio.sleep(random.random() * think)
+        message = cog.games.get_message(user.id)
+        if message is None:
+            break
+        reaction = SimpleNamespace(message=message, emoji=random.choice(ARROWS))
+        start = time.perf_counter()
+        await cog.on_reaction_add(reaction, user)
+        latencies["reaction"].append(time.perf_counter() - start)
+        applied += 1
+    return applied
+
+
+async def lag_probe(interval, lags, stop):
+    loop = asyncio.get_event_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def run(args):
+    from cogs.game import GameCog
+    from utils.storage import LevelStore
+
+    loop = asyncio.get_event_loop()
+    gateway = Gateway(args.latency, args.jitter)
+    bot = StubBot(loop)
+    GameCog.edit_window = args.window
+    GameCog.executor_kind = args.executor
+    cog = GameCog(bot)
+    cog.store = LevelStore(os.path.join(tempfile.mkdtemp(), "levels.db"), legacy=None)
+    await asyncio.sleep(0.1)
+
+    kinds = ("infinite", "challenge", "custom")
+    users = [SimpleNamespace(id=i + 1, name=f"user{i}") for i in range(args.players)]
+    channels = [StubChannel(gateway, 10 ** 6 + i) for i in range(args.players)]
+    latencies = {"command": list(), "reaction": list()}
+    lags = list()
+    stop = asyncio.Event()
+    probe = asyncio.ensure_future(lag_probe(0.01, lags, stop))
+    watchdog = LoopWatchdog(loop, bot.logger)
+    watchdog.start()
+
+    tracemalloc.start()
+    memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    applied = await asyncio.gather(*[
+        player(cog, gateway, user, channel, kinds[i % len(kinds)], args.moves, args.think, latencies)
+        for i, (user, channel) in enumerate(zip(users, channels))
+    ])
+    elapsed = time.perf_counter() - start
+    active = len(cog.games.games)
+    memory = tracemalloc.get_traced_memory()[0] - memory
+    tracemalloc.stop()
+    setup_calls = gateway.total()
+    await asyncio.sleep(args.window + args.latency + args.jitter + 0.1)
+    stop.set()
+    await probe
+    watchdog.stop()
+    cog.cog_unload()
+
+    moves = sum(applied)
+    events = moves + args.players
+    print(f"players:              {args.players}")
+    print(f"events handled:       {events} in {elapsed:.2f}s ({events / elapsed:,.0f} events/s)")
+    for name, values in latencies.items():
+        print(f"{name + ' latency:':<22}p50 {percentile(values, .5) * 1000:.2f}ms  "
+              f"p99 {percentile(values, .99) * 1000:.2f}ms")
+    print(f"loop lag:             p50 {percentile(lags, .5) * 1000:.2f}ms  max {max(lags or [0]) * 1000:.2f}ms  "
+          f"stalls {watchdog.stalls}")
+    print(f"active games:         {active}")
+    print(f"memory per game:      {memory / max(active, 1) / 1024:.1f} KiB")
+    print(f"api calls:            {gateway.calls} ({setup_calls} before drain)")
+    print(f"api calls per move:   {gateway.total() / max(moves, 1):.3f}")
+    print(f"edit scheduler:       {cog.scheduler.stats()}")
+    print(f"level pool:           {cog.pool.stats()}")
+    print(f"executor:             {cog.executor.stats()}")
+    for name in ("move_seconds", "render_seconds"):
+        histogram = bot.metrics.histogram(name)
+        print(f"{name + ':':<22}n={histogram.count} p99≤{histogram.quantile(.99) * 1000:g}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic players through GameCog with a fake gateway")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--moves", type=int, default=30)
+    parser.add_argument("--think", type=float, default=0.05, help="max delay between a player's reactions")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated API round trip")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--window", type=float, default=1.0, help="edit coalescing window")
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,80 @@
 import discord
 import asyncio
-import json
+import re
+import sqlite3
+import time
 
+from concurrent.futures.process import BrokenProcessPool
 from discord.ext import commands, tasks
-from utils.game import Games, GameError
+from utils.executor import JobExecutor
+from utils.game import Games, GameError, create_game, seeded_board
+from utils.pool import LevelPool
+from utils.scheduler import EditScheduler
+from utils.solver import SolutionCache, search
+from utils.packs import PackLibrary, PackError
+from utils.storage import LevelStore
 
 
 class GameCog(commands.Cog):
+    pool_depth = 4
+    edit_window = 1.0
+    edit_budget = 20
+    max_live_games = 500
+    idle_after = 10 * 60
+    game_ttl = 24 * 60 * 60
+    executor_kind = "process"
+    executor_workers = None
+    job_timeout = 5.0
+    max_level = 10 ** 6
+    solution_cache = 4096
+    hint_nodes = 200000
+    hint_budget = 2.0
+
     def __init__(self, bot):
         self.bot = bot
-        self.valid_messages = list()
-        self.games = Games()
-
-        with open("config/levels.json", "r") as fp:
-            self.levels = json.load(fp)
+        self.games = Games(max_live=self.max_live_games)
+        self.executor = JobExecutor(self.executor_kind, workers=self.executor_workers, timeout=self.job_timeout)
+        self.hints = JobExecutor(self.executor_kind, workers=1, timeout=self.job_timeout)
+        self.pool = LevelPool(seeded_board, depth=self.pool_depth, executor=self.executor, logger=self.bot.logger)
+        self.pool.start(self.bot.loop)
+        self.scheduler = EditScheduler(window=self.edit_window, max_outstanding=self.edit_budget,
+                                       metrics=self.bot.metrics)
+        self.store = LevelStore(logger=self.bot.logger)
+        self.packs = PackLibrary()
+        self.solutions = SolutionCache(self.solution_cache)
+        self.seeding = set()
 
         self.save_levels.start()
+        self.sweep_games.start()
+        self.bot.loop.create_task(self.warm())
+
+    def cog_unload(self):
+        self.save_levels.cancel()
+        self.sweep_games.cancel()
+        self.pool.stop()
+        for task in self.seeding:
+            task.cancel()
+        self.executor.shutdown()
+        self.hints.shutdown()
+        self.bot.loop.create_task(self.store.close())
+
+    async def warm(self):
+        start = time.perf_counter()
+        try:
+            await self.store.open()
+        except sqlite3.Error as e:
+            self.bot.logger.error(f"Could not open the level store: {e}")
+        await self.executor.warm("utils.game")
+        seconds = time.perf_counter() - start
+        self.bot.metrics.gauge("startup_seconds", "Time spent in each startup phase", phase="warm").set(seconds)
+        self.bot.logger.info(f"Warmed level data in {seconds:.3f}s")
 
     @commands.is_owner()
     @commands.command()
     async def force_save(self, ctx):
-        with open("config/levels.json", "w") as fp:
-            json.dump(self.levels, fp)
-        self.bot.logger.info("[ADMIN] Saving custom levels json")
-        await ctx.send("Saved custom levels json")
+        saved = await self.store.flush()
+        self.bot.logger.info("[ADMIN] Saving custom levels")
+        await ctx.send("Saved custom levels" if saved else "No unsaved custom levels")
 
     @commands.group()
     async def play(self, ctx):
@@ -33,27 +84,49 @@ class GameCog(commands.Cog):
     async def infinite(self, ctx, emoji=None, level="1"):
         if self.games.check_active(ctx.author.id, ctx.channel.id):
             return await ctx.send("Cannot start game: game is already active in this channel")
+        level = self.parse_level(level)
+        if level is None:
+            return await ctx.send(f"Level must be a whole number from 1 to {self.max_level}")
         self.bot.logger.info(f"[{ctx.author.id}] Started new infinite game")
-        self.games.new(ctx.author, ctx.channel, level_id=level, emoji_player=emoji)
-        game = self.games.get_game(ctx.author.id)
+        seed, board = self.pool.pop(int(level)) or (None, None)
+        try:
+            game = await self.new_game(ctx.author, ctx.channel, level_id=level, emoji_player=emoji, board=board,
+                                       seed=seed)
+        except GameError as e:
+            return await ctx.send(e.message)
         await self.finish_setup(ctx, title=f"Level {game.level_id}")
 
     @play.command(name="challenge", aliases=["moves", "c"])
     async def challenge(self, ctx, emoji=None, level="1"):
         if self.games.check_active(ctx.author.id, ctx.channel.id):
             return await ctx.send("Cannot start game: game is already active in this channel")
+        level = self.parse_level(level)
+        if level is None:
+            return await ctx.send(f"Level must be a whole number from 1 to {self.max_level}")
         self.bot.logger.info(f"[{ctx.author.id}] Started new infinite game")
         moves = 5 + (10 * round(.51 * int(level)))
-        self.games.new(ctx.author, ctx.channel, level_id=level, emoji_player=emoji, moves=moves)
-        game = self.games.get_game(ctx.author.id)
+        seed, board = self.pool.pop(int(level)) or (None, None)
+        try:
+            game = await self.new_game(ctx.author, ctx.channel, level_id=level, emoji_player=emoji, moves=moves,
+                                       board=board, seed=seed)
+        except GameError as e:
+            return await ctx.send(e.message)
         await self.finish_setup(ctx, title=f"Level {game.level_id}")
 
+    def parse_level(self, level):
+        try:
+            level = int(level)
+        except ValueError:
+            return None
+        return str(level) if 1 <= level <= self.max_level else None
+
     @commands.command(aliases=["quit"])
     async def end(self, ctx):
         if not self.games.check_active(ctx.author.id, ctx.channel.id):
             return await ctx.send("Cannot end game: no game to end")
         self.bot.logger.info(f"[{ctx.author.id}] Ended game")
         self.games.delete(ctx.author.id)
+        self.track_games()
         await ctx.send("Ended game!")
 
     @commands.group()
@@ -70,7 +143,7 @@ class GameCog(commands.Cog):
         self.bot.logger.info(f"[{ctx.author.id}] Submitted new custom level file")
         file = await ctx.message.attachments[0].read()
         try:
-            self.games.new(ctx.author, ctx.channel, emoji_player=emoji, file=file)
+            await self.new_game(ctx.author, ctx.channel, emoji_player=emoji, file=file)
         except GameError as e:
             self.bot.logger.info(f"[{ctx.author.id}] File was deemed invalid")
             await ctx.send(e.message)
@@ -83,7 +156,7 @@ class GameCog(commands.Cog):
             return await ctx.send("Cannot start game: game is already active in this channel")
         self.bot.logger.info(f"[{ctx.author.id}] Submitted new custom level string")
         try:
-            self.games.new(ctx.author, ctx.channel, emoji_player=None, text=text)
+            await self.new_game(ctx.author, ctx.channel, emoji_player=None, text=text)
         except GameError as e:
             self.bot.logger.info(f"[{ctx.author.id}] String was deemed invalid")
             await ctx.send(e.message)
@@ -91,75 +164,248 @@ class GameCog(commands.Cog):
         await self.finish_setup(ctx, title="Custom Level")
 
     @custom.command(name="load")
-    async def load(self, ctx, member: discord.Member = None, emoji: str = None):
+    async def load(self, ctx, target: str = None, *args):
         if self.games.check_active(ctx.author.id, ctx.channel.id):
             return await ctx.send("Cannot start game: game is already active in this channel")
-        member = member or ctx.author
-        level = self.levels.get(str(member.id))
+        if target is not None and target.startswith("pack:"):
+            return await self.load_pack(ctx, target[5:], *args[:2])
+        emoji = args[0] if args else None
+        try:
+            member = await commands.MemberConverter().convert(ctx, target) if target else ctx.author
+        except commands.BadArgument:
+            return await ctx.send("Cannot find level")
+        level = await self.store.get(member.id)
         if not level:
             await ctx.send("Cannot find level")
             return
         self.bot.logger.info(f"[{ctx.author.id}] Started playing {member.id}'s level")
-        self.games.new(ctx.author, ctx.channel, emoji_player=emoji, content=level)
+        try:
+            await self.new_game(ctx.author, ctx.channel, emoji_player=emoji, content=level)
+        except GameError as e:
+            return await ctx.send(e.message)
         await self.finish_setup(ctx, title="Custom Level")
 
+    async def load_pack(self, ctx, name, number="1", emoji=None):
+        name = name.lower()
+        try:
+            level = self.packs.get(name, int(number))
+        except ValueError:
+            return await ctx.send("Level number must be a whole number")
+        except PackError as e:
+            return await ctx.send(e.message)
+        self.bot.logger.info(f"[{ctx.author.id}] Started playing level {number} of pack {name}")
+        try:
+            await self.new_game(ctx.author, ctx.channel, emoji_player=emoji, content=level)
+        except GameError as e:
+            await ctx.send(e.message)
+            return
+        await self.finish_setup(ctx, title=f"{name} #{number}")
+
+    @commands.is_owner()
+    @custom.command(name="import")
+    async def import_pack(self, ctx, name: str):
+        if not ctx.message.attachments:
+            await ctx.send("You must provide a level pack file for me to import!")
+            return
+        data = await ctx.message.attachments[0].read()
+        try:
+            count = await self.bot.loop.run_in_executor(None, self.packs.import_pack, name.lower(), data)
+        except PackError as e:
+            await ctx.send(e.message)
+            return
+        self.packs.install(name.lower())
+        self.bot.logger.info(f"[ADMIN] Imported {count} levels into pack {name.lower()}")
+        await ctx.send(f"Imported {count} levels into pack {name.lower()}")
+
+    @custom.command(name="packs")
+    async def packs_list(self, ctx):
+        names = self.packs.names()
+        if not names:
+            return await ctx.send("No level packs have been imported")
+        lines = [f"pack:{name} ({self.packs.count(name)} levels)" for name in names]
+        embed = discord.Embed(title="Level packs", description="\n".join(lines),
+                              color=discord.Color.red())
+        await ctx.send(embed=embed)
+
+    async def new_game(self, user, channel, **kwargs):
+        try:
+            game, player = await self.executor.run(create_game, **kwargs)
+        except asyncio.TimeoutError:
+            raise GameError("Setting up this level took too long, try a smaller level")
+        except BrokenProcessPool:
+            raise GameError("Setting up this level failed, please try again")
+        if self.games.check_active(user.id, channel.id):
+            raise GameError("Cannot start game: game is already active in this channel")
+        if game.pushes:
+            self.solutions.add(*game.problem(), {"status": "solved", "pushes": game.pushes})
+        self.games.add(user, channel, game, player)
+        return game
+
     async def finish_setup(self, ctx, title):
-        board = self.games.format_board(ctx.author.id)
+        kwargs = self.games.render(ctx.author.id, title=title)
         game = self.games.get_game(ctx.author.id)
-        embed = discord.Embed(title=title, description=board, color=discord.Color.red())
-        if game.moves:
-            embed.add_field(name="Moves left:", value=game.moves)
-        msg = await ctx.send(embed=embed)
-        await self.games.react_to(msg)
-        self.valid_messages.append(msg.id)
+        if game.solvable == "unknown":
+            kwargs["embed"].set_footer(text="This level could not be verified as solvable in time")
+        try:
+            msg = await self.api("send", ctx.send(**kwargs))
+        except discord.HTTPException:
+            self.games.delete(ctx.author.id)
+            self.track_games()
+            raise
+        self.games.register_message(ctx.author.id, msg)
+        self.track_games()
+        self.seed_reactions(msg)
         self.bot.logger.debug(f"[{ctx.author.id}] Finished game setup")
 
+    def seed_reactions(self, message):
+        task = asyncio.ensure_future(self.api("react", self.games.react_to(message)))
+        self.seeding.add(task)
+        task.add_done_callback(self.seeded)
+
+    def seeded(self, task):
+        self.seeding.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.bot.logger.warning(f"Could not add game reactions: {task.exception()}")
+
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction, user):
-        if not reaction.message.id in self.valid_messages or user.id == self.bot.user.id:
+        if user.id == self.bot.user.id or self.games.get_owner(reaction.message.id) != user.id:
+            return
+        if reaction.emoji not in self.games.emojis:
             return
         game = self.games.get_game(user.id)
         if reaction.emoji == "🔁":
             game.reset()
-            game.moves_made = 0
-            await self.games.update_board(user, reaction.message)
+            self.scheduler.schedule(reaction.message, lambda: self.render(user.id))
             self.bot.logger.debug(f"[{user.id}] Reset board")
         else:
-            results = await game.move(reaction.emoji)
-            await self.games.update_board(user, reaction.message)
+            with self.bot.metrics.time("move_seconds", "Time spent applying moves to a game"):
+                if reaction.emoji == "↩️":
+                    results = game.undo()
+                elif reaction.emoji == "↪️":
+                    results = game.redo()
+                else:
+                    results = game.move(reaction.emoji)
+            if not results["moved"]:
+                return
+            self.bot.metrics.counter("moves_total", "Moves applied to games").inc()
+            self.scheduler.schedule(reaction.message, lambda: self.render(user.id))
             self.bot.logger.debug(f"[{user.id}] Moved player piece")
-            if results["win"]:
+            await self.handle_results(game, user, reaction.message, results)
+
+    @commands.command(name="m", aliases=["move"])
+    async def move_string(self, ctx, *, moves):
+        await self.play_moves(ctx, moves, reset=False)
+
+    @commands.command()
+    async def replay(self, ctx, *, moves):
+        await self.play_moves(ctx, moves, reset=True)
+
+    async def play_moves(self, ctx, moves, reset):
+        game = self.games.get_game(ctx.author.id)
+        if game is None:
+            return await ctx.send("Cannot move: no active game")
+        moves = re.sub(r"\s+", "", moves).upper()
+        if not re.fullmatch(r"[LURD]{1,500}", moves):
+            return await ctx.send("Moves must be made up of the letters L, U, R and D (500 at most)")
+        if reset:
+            game.reset()
+        with self.bot.metrics.time("move_seconds", "Time spent applying moves to a game"):
+            results = game.play(moves)
+        self.bot.metrics.counter("moves_total", "Moves applied to games").inc(results["applied"])
+        self.bot.logger.debug(f"[{ctx.author.id}] Applied {results['applied']} of {len(moves)} moves")
+        message = self.games.get_message(ctx.author.id)
+        if message is None or not (results["moved"] or reset):
+            return
+        self.scheduler.schedule(message, lambda: self.render(ctx.author.id))
+        await self.handle_results(game, ctx.author, message, results)
+
+    @commands.command()
+    async def hint(self, ctx):
+        game = self.games.get_game(ctx.author.id)
+        if game is None:
+            return await ctx.send("Cannot give a hint: no active game")
+        problem = game.problem()
+        hint = self.solutions.lookup(*problem)
+        if hint is None:
+            self.bot.logger.debug(f"[{ctx.author.id}] Searching for a hint")
+            try:
+                with self.bot.metrics.time("hint_seconds", "Time spent searching for hints"):
+                    result = await self.hints.run(search, *problem, max_nodes=self.hint_nodes,
+                                                     time_limit=self.hint_budget)
+            except asyncio.TimeoutError:
+                return await ctx.send("The solver is busy right now, try again in a moment")
+            except BrokenProcessPool:
+                return await ctx.send("The solver stopped unexpectedly, try again in a moment")
+            self.solutions.add(*problem, result)
+            if result["status"] == "unknown":
+                return await ctx.send("Could not find a solution yet, ask for another hint to keep searching")
+            hint = self.solutions.lookup(*game.problem())
+            if hint is None:
+                return await ctx.send("The board changed while I was searching, ask for another hint")
+        self.bot.metrics.counter("hints_total", "Hints given").inc()
+        if hint["status"] == "invalid":
+            return await ctx.send("This position can no longer be solved, undo some moves or reset the board")
+        await ctx.send(f"Next push: `{hint['moves']}` ({hint['pushes']} pushes left)")
+
+    def render(self, user_id):
+        with self.bot.metrics.time("render_seconds", "Time spent rendering a board embed"):
+            return self.games.render(user_id)
+
+    async def api(self, call, awaitable):
+        with self.bot.metrics.time("api_seconds", "Time spent waiting on Discord API calls", call=call):
+            return await awaitable
+
+    def track_games(self):
+        metrics = self.bot.metrics
+        metrics.gauge("active_games", "Games currently registered").set(len(self.games.games))
+        metrics.gauge("live_games", "Games currently held in memory").set(len(self.games.live))
+        metrics.gauge("evictions", "Games hibernated since startup").set(self.games.evictions)
+        metrics.gauge("expirations", "Games expired since startup").set(self.games.expirations)
+        for key, value in self.scheduler.stats().items():
+            metrics.gauge(f"edits_{key}", "Board edit scheduler counters").set(value)
+        for key, value in self.pool.stats().items():
+            metrics.gauge(f"pool_{key}", "Level pool counters").set(value)
+        for key, value in self.solutions.stats().items():
+            metrics.gauge(f"solutions_{key}", "Solution cache counters").set(value)
+
+    async def handle_results(self, game, user, message, results):
+        if results["win"]:
+            self.bot.metrics.counter("wins_total", "Levels won").inc()
+            if game.random_levels:
+                self.scheduler.discard(message.id)
                 self.games.delete(user.id)
-                idx = self.valid_messages.index(reaction.message.id)
-                del self.valid_messages[idx]
-                if game.random_levels:
-                    await self.random_level_win(game, user, reaction.message)
-                else:
-                    await self.custom_level_win(game, user, reaction.message)
-            elif results["loss"]:
+                await self.random_level_win(game, user, message)
+            else:
+                await self.scheduler.flush(message)
                 self.games.delete(user.id)
-                idx = self.valid_messages.index(reaction.message.id)
-                del self.valid_messages[idx]
-                await self.game_loss(game, user, reaction.message)
+                await self.custom_level_win(game, user, message)
+        elif results["loss"]:
+            self.bot.metrics.counter("losses_total", "Levels lost").inc()
+            await self.scheduler.flush(message)
+            self.games.delete(user.id)
+            await self.game_loss(game, user, message)
 
     async def random_level_win(self, game, user, message):
         self.bot.logger.info(f"[{user.id}] Won level")
-        embed = discord.Embed(title="You win!", description="Wow! Good job!", color=discord.Color.red())
-        embed.set_footer(text=f"Next level: {game.next_level}")
         moves = None
         if game.moves:
             moves = 7 + (8 * round(.51 * int(game.level_id) + 1))
-        await message.channel.send(embed=embed)
-        self.games.new(user, message.channel, emoji_player=game.emoji_player,
-                       level_id=game.next_level, moves=moves)
-        board = self.games.format_board(user.id)
-        game = self.games.get_game(user.id)
-        embed = discord.Embed(title=f"Level {game.level_id}", description=board, color=discord.Color.red())
-        if game.moves:
-            embed.add_field(name="Moves left:", value=game.moves)
-        msg = await message.channel.send(embed=embed)
-        await self.games.react_to(msg)
-        self.valid_messages.append(msg.id)
+        seed, board = self.pool.pop(int(game.next_level)) or (None, None)
+        try:
+            await self.new_game(user, message.channel, emoji_player=game.emoji_player,
+                                level_id=game.next_level, moves=moves, board=board, seed=seed)
+        except GameError as e:
+            return await message.channel.send(e.message)
+        self.games.register_message(user.id, message)
+        self.scheduler.schedule(message, lambda: self.level_up(user.id, game.level_id))
+        await self.scheduler.flush(message)
+
+    def level_up(self, user_id, level_id):
+        kwargs = self.render(user_id)
+        if kwargs is not None:
+            kwargs["embed"].set_author(name=f"You win! Level {level_id} complete")
+        return kwargs
 
     async def custom_level_win(self, game, user, message):
         self.bot.logger.info(f"[{user.id}] Won custom level")
@@ -177,7 +423,7 @@ class GameCog(commands.Cog):
                 return
             if r.emoji == "✅":
                 self.bot.logger.info(f"[{user.id}] Saved custom level")
-                self.levels[str(user.id)] = game.board_string
+                self.store.put(user.id, game.board_string)
                 embed = discord.Embed(title="Level saved!", color=discord.Color.red())
                 await msg.edit(embed=embed)
             else:
@@ -196,9 +442,29 @@ class GameCog(commands.Cog):
 
     @tasks.loop(minutes=20)
     async def save_levels(self):
-        with open("config/levels.json", "w") as fp:
-            json.dump(self.levels, fp)
-        self.bot.logger.info("Saving custom levels json")
+        try:
+            if await self.store.flush():
+                self.bot.logger.info("Saving custom levels")
+        except sqlite3.Error as e:
+            self.bot.logger.error(f"Could not save custom levels: {e}")
+
+    @tasks.loop(minutes=1)
+    async def sweep_games(self):
+        expired = self.games.sweep(self.idle_after, self.game_ttl)
+        self.track_games()
+        for entry in expired:
+            self.bot.logger.info(f"[{entry['user']}] Game expired after inactivity")
+            message = entry["message"]
+            if message is None:
+                continue
+            self.scheduler.discard(message.id)
+            embed = discord.Embed(title="Game expired", description="This game was ended after a long period of inactivity",
+                                  color=discord.Color.red())
+            try:
+                await message.edit(embed=embed)
+                await message.clear_reactions()
+            except discord.HTTPException:
+                pass
 
 
 def setup(bot):
@@ -1,24 +1,84 @@
 import discord
+import asyncio
+import time
 
-from discord.ext import commands
+from discord.ext import commands, tasks
+from utils.watchdog import LoopWatchdog
 
 
 class Handler(commands.Cog):
+    metrics_path = "config/metrics.prom"
+    stall_threshold = 0.25
+
     def __init__(self, bot):
         self.bot = bot
+        self.last_tick = None
+        self.watchdog = LoopWatchdog(bot.loop, bot.logger, threshold=self.stall_threshold)
+        self.watchdog.start()
+        self.measure_lag.start()
+        self.write_metrics.start()
+
+    def cog_unload(self):
+        self.watchdog.stop()
+        self.measure_lag.cancel()
+        self.write_metrics.cancel()
 
     @commands.Cog.listener()
     async def on_command(self, ctx):
+        ctx.started_at = time.perf_counter()
         args = list()
         for arg in ctx.args:
             if not (isinstance(arg, commands.Cog) or isinstance(arg, commands.Context)):
                 args.append(arg)
         self.bot.logger.info(f"[{ctx.author.id}] invoked command {ctx.command.name} [args: {args} kwargs: {ctx.kwargs}]")
 
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        started_at = getattr(ctx, "started_at", None)
+        if started_at is not None:
+            self.bot.metrics.histogram("command_seconds", "Time spent handling a command",
+                                       command=ctx.command.qualified_name).observe(time.perf_counter() - started_at)
+
     # @commands.Cog.listener()
     # async def on_command_error(self, ctx, error):
     #     self.bot.logger.error(f"Command {ctx.command.name} errored out: {error.__class__.__name__}: {str(error)}")
 
+    @commands.is_owner()
+    @commands.command()
+    async def stats(self, ctx):
+        metrics = self.bot.metrics
+        embed = discord.Embed(title="Stats", color=discord.Color.red())
+        counters = list()
+        timings = list()
+        for (name, labels), metric in sorted(metrics.metrics.items(), key=lambda item: item[0]):
+            name = name[len(metrics.prefix) + 1:]
+            if labels:
+                name += "{" + ",".join(str(label) for _, label in labels) + "}"
+            if metric.kind == "histogram":
+                if metric.count:
+                    timings.append(f"{name}: n={metric.count} p50≤{metric.quantile(.5) * 1000:g}ms "
+                                   f"p99≤{metric.quantile(.99) * 1000:g}ms")
+            else:
+                counters.append(f"{name}: {metric.value:g}")
+        embed.add_field(name="Counters", value="\n".join(counters) or "None", inline=False)
+        embed.add_field(name="Timings", value="\n".join(timings)[:1024] or "None", inline=False)
+        await ctx.send(embed=embed)
+
+    @tasks.loop(seconds=1)
+    async def measure_lag(self):
+        now = time.perf_counter()
+        if self.last_tick is not None:
+            lag = max(now - self.last_tick - self.measure_lag.seconds, 0)
+            self.bot.metrics.gauge("event_loop_lag_seconds", "Delay of the last 1s event loop tick").set(lag)
+            self.bot.metrics.gauge("event_loop_stalls", "Event loop stalls over the watchdog threshold").set(
+                self.watchdog.stalls)
+        self.last_tick = now
+
+    @tasks.loop(seconds=15)
+    async def write_metrics(self):
+        text = self.bot.metrics.render()
+        await asyncio.get_event_loop().run_in_executor(None, self.bot.metrics.write, self.metrics_path, text)
+
 
 def setup(bot):
     bot.add_cog(Handler(bot))
@@ -1,21 +1,48 @@
+import time
+
+started = time.perf_counter()
+
 import discord
 
 from discord.ext import commands
 from utils.auth import Auth
 from utils.logger import setup_logger
+from utils.metrics import Metrics
+
+
+EXTENSIONS = ("cogs.handler", "cogs.game")
 
 
-bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
-bot.logger = setup_logger(__name__, False)
+def create_bot():
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
+    bot.logger = setup_logger(__name__, False)
+    bot.metrics = Metrics()
+    bot.startup = {"import": time.perf_counter() - started}
 
+    @bot.event
+    async def on_ready():
+        if "ready" in bot.startup:
+            bot.logger.info("Reconnected to Discord")
+            return
+        bot.startup["ready"] = time.perf_counter() - started
+        for phase, seconds in bot.startup.items():
+            bot.metrics.gauge("startup_seconds", "Time spent in each startup phase", phase=phase).set(seconds)
+        bot.logger.info("Startup: " + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in bot.startup.items()))
 
-@bot.event
-async def on_ready():
-    bot.load_extension("cogs.handler")
-    bot.load_extension("cogs.game")
+    return bot
+
+
+def load_extensions(bot):
+    start = time.perf_counter()
+    for extension in EXTENSIONS:
+        loaded = time.perf_counter()
+        bot.load_extension(extension)
+        bot.startup[extension] = time.perf_counter() - loaded
+    bot.startup["cogs"] = time.perf_counter() - start
     bot.logger.info("Loaded all cogs")
 
 
 if __name__ == "__main__":
+    bot = create_bot()
+    load_extensions(bot)
     bot.run(Auth.TOKEN)
-
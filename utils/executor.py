@@ -0,0 +1,72 @@
+import asyncio
+import functools
+import importlib
+import multiprocessing
+import os
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def preload(*modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+class JobExecutor:
+    def __init__(self, kind="process", workers=None, timeout=5.0):
+        self.kind = kind
+        self.timeout = timeout
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = self.create()
+        self.completed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.restarts = 0
+
+    def create(self):
+        if self.kind == "process":
+            return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        elif self.kind == "thread":
+            return ThreadPoolExecutor(self.workers, thread_name_prefix="jobs")
+        raise ValueError(f"Unknown executor kind {self.kind}")
+
+    async def submit(self, func, args, kwargs, timeout):
+        loop = asyncio.get_event_loop()
+        pool = self.pool
+        try:
+            future = loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except BrokenProcessPool:
+            if pool is self.pool:
+                self.restarts += 1
+                pool.shutdown(wait=False)
+                self.pool = self.create()
+            raise
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        try:
+            try:
+                result = await self.submit(func, args, kwargs, timeout)
+            except BrokenProcessPool:
+                result = await self.submit(func, args, kwargs, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.completed += 1
+        return result
+
+    async def warm(self, *modules):
+        if self.kind != "process":
+            return
+        await asyncio.gather(*[self.run(preload, *modules) for _ in range(self.workers)], return_exceptions=True)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def stats(self):
+        return {"completed": self.completed, "timeouts": self.timeouts, "cancelled": self.cancelled,
+                "restarts": self.restarts}
@@ -1,82 +1,203 @@
-import copy
 import discord
-import emojis
+import pickle
 import random
 import re
+import struct
+import time
+import zlib
+
+from collections import OrderedDict, deque
+
+from utils.solver import solve
+
+
+TILES = ("empty", "wall", "goal", "box", "completed_box", "player", "enemy")
+EMPTY, WALL, GOAL, BOX, COMPLETED_BOX, PLAYER, ENEMY = range(len(TILES))
+TILE_CODES = {name: code for code, name in enumerate(TILES)}
+TILE_CODES["goal_player"] = PLAYER
+FLOORS = {"wall": WALL, "goal": GOAL, "completed_box": GOAL, "goal_player": GOAL}
+XSB_TILES = {"#": "wall", "@": "player", "p": "player", "+": "goal_player", "P": "goal_player", "$": "box",
+             "b": "box", "*": "completed_box", "B": "completed_box", ".": "goal", " ": "empty", "-": "empty",
+             "_": "empty"}
+XSB_PATTERN = re.compile(r"(?:\d*[#@p+P$b*B. \-_]|\|)+")
+XSB_TOKEN = re.compile(r"(\d*)([#@p+P$b*B. \-_])")
+FENCE_PATTERN = re.compile(r"^`+[A-Za-z]*")
+MOVES_PATTERN = re.compile(r"\s*(?:-\s?)?\s?moves:\s?(\d+)\s*")
+LETTERS = b"LRUD"
+GENERATOR_VERSION = 3
+EMBED_LIMIT = 4096
+FORMAT_KEY = {"player": "🔵", "empty": "⬛", "box": "🟫", "completed_box": "❎", "wall": "🟥", "border": "🟥", "goal": "🔸", "enemy": "🔴"}
 
 
 class Games:
-    def __init__(self):
-        self.games = list()
-        self.format_key = {"player": "🔵", "empty": "⬛", "box": "🟫", "completed_box": "❎", "wall": "🟥", "border": "🟥", "goal": "🔸", "enemy": "🔴"}
-        self.emojis = ["⬅️", "⬆️", "➡️", "⬇️", "🔁"]
+    def __init__(self, max_live=500):
+        self.games = OrderedDict()
+        self.live = OrderedDict()
+        self.channels = dict()
+        self.messages = dict()
+        self.max_live = max_live
+        self.evictions = 0
+        self.expirations = 0
+        self.format_key = FORMAT_KEY
+        self.emojis = ["⬅️", "⬆️", "➡️", "⬇️", "↩️", "↪️", "🔁"]
 
     def check_active(self, user_id, channel_id):
-        for game in self.games:
-            if game["user"] == user_id or game["channel"] == channel_id:
-                return True
-        return False
-
-    def new(self, user, channel, emoji_player, level_id="1", moves=None, file=None, content=None, text=None):
-        def check_emoji(emoji):
-            if (not re.match(r"<a?:[!-~]+:\d+>", emoji)) and (emojis.count(emoji) == 0 or emojis.count(emoji) > 1):
-                return None
-            return emoji
-        self.format_key["player"] = "🔵" if emoji_player is None else (check_emoji(emoji_player) or "🔵")
-        self.games.append(
-            {
-                "user": user.id,
-                "channel": channel.id,
-                "game": GameManager(level_id, emoji_player=emoji_player, moves=moves, file=file,
-                                    content=content, text=text)
-            }
-        )
+        return user_id in self.games or channel_id in self.channels
+
+    def new(self, user, channel, emoji_player, **kwargs):
+        game, player = create_game(emoji_player=emoji_player, **kwargs)
+        self.add(user, channel, game, player)
+
+    def add(self, user, channel, game, player):
+        palette = dict(self.format_key)
+        palette["player"] = player
+        self.delete(user.id)
+        self.games[user.id] = {"user": user.id, "channel": channel.id, "message": None, "game": game,
+                               "packed": None, "renderer": BoardRenderer(palette),
+                               "title": None, "touched": time.monotonic()}
+        self.channels[channel.id] = user.id
+        self.live[user.id] = None
+        self.evict()
+
+    def register_message(self, user_id, message):
+        entry = self.games[user_id]
+        if entry["message"] is not None:
+            self.messages.pop(entry["message"].id, None)
+        entry["message"] = message
+        self.messages[message.id] = user_id
 
     def delete(self, user_id):
-        next = None
-        for game in range(len(self.games)):
-            if self.games[game]["user"] == user_id:
-                next = self.games[game]["game"].next_level
-                del self.games[game]
-        return next
+        entry = self.games.pop(user_id, None)
+        if entry is None:
+            return
+        self.live.pop(user_id, None)
+        if self.channels.get(entry["channel"]) == user_id:
+            del self.channels[entry["channel"]]
+        if entry["message"] is not None:
+            self.messages.pop(entry["message"].id, None)
 
     def get_game(self, user_id):
-        for game in self.games:
-            if game["user"] == user_id:
-                return game["game"]
-        return None
+        entry = self.games.get(user_id)
+        if entry is None:
+            return None
+        entry["touched"] = time.monotonic()
+        self.games.move_to_end(user_id)
+        if entry["game"] is None:
+            entry["game"] = GameManager.unpack(entry["packed"])
+            entry["packed"] = None
+            self.live[user_id] = None
+            self.evict()
+        else:
+            self.live.move_to_end(user_id)
+        return entry["game"]
+
+    def hibernate(self, user_id):
+        entry = self.games[user_id]
+        self.live.pop(user_id, None)
+        if entry["game"] is not None:
+            entry["packed"] = entry["game"].pack()
+            entry["game"] = None
+            entry["renderer"].rows = list()
+            self.evictions += 1
+
+    def evict(self):
+        while len(self.live) > self.max_live:
+            user_id, _ = self.live.popitem(last=False)
+            self.hibernate(user_id)
+
+    def sweep(self, idle, ttl):
+        now = time.monotonic()
+        for user_id in list(self.live):
+            if now - self.games[user_id]["touched"] < idle:
+                break
+            self.hibernate(user_id)
+        expired = list()
+        for user_id, entry in list(self.games.items()):
+            if now - entry["touched"] < ttl:
+                break
+            self.delete(user_id)
+            self.expirations += 1
+            expired.append(entry)
+        return expired
+
+    def get_message(self, user_id):
+        entry = self.games.get(user_id)
+        return entry["message"] if entry is not None else None
+
+    def get_owner(self, message_id):
+        return self.messages.get(message_id)
 
     def format_board(self, user_id):
         game = self.get_game(user_id)
-        border = self.format_key["border"] * (game.height + 2)
-        content = border + "\n"
-        for row in game.board:
-            content += self.format_key["border"]
-            for entry in row:
-                content += self.format_key[entry]
-            content += self.format_key["border"] + "\n"
-        content += border
-        return content
+        return self.games[user_id]["renderer"].render(game)
 
     async def react_to(self, message):
         for emoji in self.emojis:
             await message.add_reaction(emoji)
 
-    async def update_board(self, user, message):
-        board = self.format_board(user.id)
-        game = self.get_game(user.id)
-        title = f"Level {game.level_id}" if game.random_levels else "Custom Level"
-        embed = discord.Embed(title=title, description=board, color=discord.Color.red())
+    def render(self, user_id, title=None):
+        game = self.get_game(user_id)
+        if game is None:
+            return None
+        entry = self.games[user_id]
+        if title is not None:
+            entry["title"] = title
+        title = entry["title"] or (f"Level {game.level_id}" if game.random_levels else "Custom Level")
+        embed = discord.Embed(title=title, description=self.format_board(user_id), color=discord.Color.red())
         if game.moves:
             embed.add_field(name="Moves left:", value=game.moves - game.moves_made)
-        await message.edit(embed=embed)
+        return {"embed": embed}
+
+
+def check_emoji(emoji):
+    import emojis
+    if (not re.match(r"<a?:[!-~]+:\d+>", emoji)) and (emojis.count(emoji) == 0 or emojis.count(emoji) > 1):
+        return None
+    return emoji
+
+
+def create_game(level_id="1", emoji_player=None, moves=None, file=None, content=None, text=None, board=None,
+                seed=None):
+    player = "🔵" if emoji_player is None else (check_emoji(emoji_player) or "🔵")
+    game = GameManager(level_id, emoji_player=emoji_player, moves=moves, file=file, content=content, text=text,
+                       board=board, seed=seed)
+    palette = dict(FORMAT_KEY)
+    palette["player"] = player
+    size = len(BoardRenderer(palette).render(game))
+    game.dirty = None
+    if size > EMBED_LIMIT:
+        raise GameError("This level is too large to display, try a smaller level")
+    return game, player
+
+
+class BoardRenderer:
+    def __init__(self, format_key):
+        self.palette = [format_key[name] for name in TILES]
+        self.border = format_key["border"]
+        self.rows = list()
+        self.edge = None
+
+    def render(self, game):
+        if len(self.rows) != game.height or game.dirty is None:
+            self.rows = [None] * game.height
+            self.edge = self.border * (game.width + 2)
+            dirty = range(game.height)
+        else:
+            dirty = game.dirty
+        palette = self.palette
+        for row in dirty:
+            self.rows[row] = self.border + "".join([palette[tile] for tile in game.row(row)]) + self.border
+        game.dirty = set()
+        return "\n".join([self.edge, *self.rows, self.edge])
 
 
 class GameManager:
-    def __init__(self, level_id, emoji_player, moves=None, file=None, content=None, text=None):
-        self.col = 0
-        self.row = 0
+    journal_size = 1000
+    chase = 0
+
+    def __init__(self, level_id, emoji_player, moves=None, file=None, content=None, text=None, board=None, seed=None):
         self.level_id = level_id
+        self.seed = seed if seed is not None else random.getrandbits(32)
         self.emoji_player = emoji_player
         self.random_levels = (not (file or content or text))
         self.max_moves = 100
@@ -85,10 +206,9 @@ class GameManager:
         self.board_string = None
 
         if self.random_levels:
-            self.board = RandomBoard(5, 5, int(self.level_id), int(self.level_id)).board
+            board = board or random_board(int(self.level_id), self.seed)
         else:
             board = CustomBoard(file, content, text)
-            board.remove_invalid_tiles()
             checks = board.check_for_validity()
             error_message = ""
             for key in checks.keys():
@@ -97,106 +217,256 @@ class GameManager:
             if error_message:
                 raise GameError(error_message)
             else:
-                self.board = board.board
                 self.moves = board.moves
                 self.board_string = board.board_string
+                board = board.board
 
-        self.initial_board = copy.deepcopy(self.board)
         self.saved = (content is not None)
-        self.find_player()
-        self.width = len(self.board)
-        self.height = len(self.board[0])
-
-        self.reactions = {"➡️": {"col": 0, "row": 1}, "⬅️": {"col": 0, "row": -1}, "⬇️": {"col": 1, "row": 0}, "⬆️": {"col": -1, "row": 0}}
-        self.immovable = ["wall", "enemy"]
-        self.movable = ["box", "completed_box"]
+        self.load(board)
+        self.solvable = None
+        self.pushes = None
+        if not self.random_levels:
+            result = self.solve()
+            self.solvable, self.pushes = result["status"], result["pushes"]
+            if self.solvable == "invalid":
+                raise GameError("No sequence of moves can place every box on a goal, rendering level impossible.")
+
+        self.reactions = self.steps()
+
+    def load(self, board):
+        self.height = len(board)
+        self.width = len(board[0])
+        self.stride = self.width + 2
+        self.board = bytearray([WALL]) * (self.stride * (self.height + 2))
+        self.floor = bytearray(self.board)
+        self.player = 0
+        self.enemies = list()
+        self.goals_left = 0
+        for row in range(self.height):
+            base = (row + 1) * self.stride + 1
+            for col, name in enumerate(board[row]):
+                tile = TILE_CODES[name]
+                idx = base + col
+                self.board[idx] = tile
+                self.floor[idx] = FLOORS.get(name, EMPTY)
+                if tile == PLAYER:
+                    self.player = idx
+                elif tile == ENEMY:
+                    self.enemies.append(idx)
+                if self.floor[idx] == GOAL and tile != COMPLETED_BOX:
+                    self.goals_left += 1
+        offsets = ((1, -1), (2, 1), (4, -self.stride), (8, self.stride))
+        self.routes = tuple(tuple(step for bit, step in offsets if mask & bit) for mask in range(16))
+        self.exits = bytearray(len(self.floor))
+        for idx, tile in enumerate(self.floor):
+            if tile != WALL:
+                self.exits[idx] = sum(bit for bit, step in offsets if self.floor[idx + step] != WALL)
+        self.initial_board = bytes(self.board)
+        self.initial_player = self.player
+        self.initial_enemies = tuple(self.enemies)
+        self.initial_goals_left = self.goals_left
+        self.initial_rng = random.Random(self.seed).getrandbits(64) | 1
+        self.reset()
+
+    def steps(self):
+        return {"➡️": 1, "⬅️": -1, "⬇️": self.stride, "⬆️": -self.stride,
+                "R": 1, "L": -1, "D": self.stride, "U": -self.stride}
 
     @property
     def next_level(self):
         return str(int(self.level_id) + 1)
 
-    def find_player(self):
-        for col in range(len(self.board)):
-            column = self.board[col]
-            for row in range(len(column)):
-                if column[row] == "player":
-                    self.col = col
-                    self.row = row
+    def row(self, row):
+        base = (row + 1) * self.stride + 1
+        return self.board[base:base + self.width]
+
+    def pack(self):
+        state = dict(self.__dict__)
+        del state["reactions"], state["dirty"]
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def unpack(cls, data):
+        game = cls.__new__(cls)
+        game.__dict__.update(pickle.loads(zlib.decompress(data)))
+        game.dirty = None
+        game.reactions = game.steps()
+        return game
+
+    def record(self):
+        custom = b""
+        if not self.random_levels:
+            custom = zlib.compress(self.board_string.encode("utf-8"))
+            custom = struct.pack("<H", len(custom)) + custom
+        header = struct.pack("<BBIIH", GENERATOR_VERSION, not self.random_levels, int(self.level_id),
+                             self.seed, self.moves or 0)
+        return header + custom + bytes(self.history)
+
+    @classmethod
+    def from_record(cls, data):
+        version, custom, level_id, seed, moves = struct.unpack_from("<BBIIH", data)
+        if version != GENERATOR_VERSION:
+            raise GameError(f"Game was recorded with generator version {version}, cannot replay it")
+        offset = struct.calcsize("<BBIIH")
+        content = None
+        if custom:
+            size, = struct.unpack_from("<H", data, offset)
+            content = zlib.decompress(data[offset + 2:offset + 2 + size]).decode("utf-8")
+            offset += 2 + size
+        game = cls(str(level_id), None, moves=moves or None, content=content, seed=seed)
+        game.play(data[offset:].decode("ascii"))
+        return game
+
+    def boxes(self):
+        return [idx for idx, tile in enumerate(self.board) if tile == BOX or tile == COMPLETED_BOX]
+
+    def problem(self):
+        walls = bytes(tile == WALL for tile in self.floor)
+        goals = [idx for idx, tile in enumerate(self.floor) if tile == GOAL]
+        return walls, goals, self.boxes(), self.player, self.stride
+
+    def solve(self, **budget):
+        return solve(*self.problem(), **budget)
 
     def reset(self):
-        self.board = copy.deepcopy(self.initial_board)
-        self.find_player()
-
-    async def move(self, emoji):
-        to_move = self.reactions[emoji]
-        after_col = self.col + to_move["col"]
-        after_row = self.row + to_move["row"]
-        if (after_col > self.width - 1 or after_col < 0) or (after_row > self.height - 1 or after_row < 0):
-            return
-        new_space = self.board[after_col][after_row]
-        if new_space in self.immovable:
-            return
-        if new_space in self.movable:
-            box = (after_col + to_move["col"], after_row + to_move["row"])
-            if (box[0] > self.width - 1 or box[0] < 0) or (box[1] > self.height - 1 or box[1] < 0):
-                return
-            new_space_box = self.board[box[0]][box[1]]
-            if new_space_box in self.immovable or new_space_box == "box":
-                return
-            self.board[box[0]][box[1]] = "box" if not self.initial_board[after_col + to_move["col"]][after_row + to_move["row"]] == "goal" else "completed_box"
-        self.board[self.col][self.row] = "empty" if self.initial_board[self.col][self.row] in ("box", "player", "enemy") \
-            else self.initial_board[self.col][self.row]
-        self.board[after_col][after_row] = "player"
-        self.col = after_col
-        self.row = after_row
-        self.move_enemies()
-        self.moves_made += 1
-        results = {"win": self.check_for_win(),
-                   "loss": False if self.moves is None else (self.moves_made >= self.moves)}
+        self.board[:] = self.initial_board
+        self.player = self.initial_player
+        self.enemies = list(self.initial_enemies)
+        self.goals_left = self.initial_goals_left
+        self.rng = self.initial_rng
+        self.moves_made = 0
+        self.journal = deque(maxlen=self.journal_size)
+        self.undone = list()
+        self.history = bytearray()
+        self.dirty = None
+
+    def state(self):
+        return self.player, self.rng, self.goals_left, tuple(self.enemies), self.moves_made
+
+    def restore(self, state):
+        self.player, self.rng, self.goals_left, enemies, self.moves_made = state
+        self.enemies = list(enemies)
+
+    def results(self, moved):
+        return {"win": self.check_for_win(),
+                "loss": False if self.moves is None else (self.moves_made >= self.moves),
+                "moved": moved}
+
+    def put(self, cells, idx, tile):
+        cells.append((idx, self.board[idx], tile))
+        self.board[idx] = tile
+
+    def play(self, moves):
+        results = {"win": False, "loss": False, "moved": False, "applied": 0}
+        for key in moves:
+            result = self.move(key)
+            if result["moved"]:
+                results["moved"] = True
+                results["applied"] += 1
+            if result["win"] or result["loss"]:
+                results["win"] = result["win"]
+                results["loss"] = result["loss"]
+                break
         return results
 
-    def find_enemies(self):
-        enemies = list()
-        for col in range(len(self.board)):
-            column = self.board[col]
-            for row in range(len(column)):
-                if column[row] == "enemy":
-                    enemies.append({"col": col, "row": row})
-        return enemies
-
-    def move_enemies(self):
-        for enemy in self.find_enemies():
-            def move(width, height):
-                to_move = {"col": 0, "row": 0}
-                num = random.randint(-1, 1)
-                to_move[random.choice(["col", "row"])] = num
-                return max(min(enemy["col"] + to_move["col"], width - 1), 0), max(min(enemy["row"] + to_move["row"], height - 1), 0)
-            after_col, after_row = move(self.width, self.height)
-            iters = 0
-            while self.board[after_col][after_row] in ("box", "completed_box", "wall", "enemy", "player"):
-                after_col, after_row = move(self.width, self.height)
-                iters += 1
-                if iters == 10:
-                    break
-            self.board[enemy["col"]][enemy["row"]] = "empty" if self.initial_board[enemy["col"]][enemy["row"]] in ("box", "player", "enemy") \
-                else self.initial_board[enemy["col"]][enemy["row"]]
-            self.board[after_col][after_row] = "enemy"
+    def move(self, emoji):
+        step = self.reactions[emoji]
+        board = self.board
+        after = self.player + step
+        new_space = board[after]
+        if new_space == WALL or new_space == ENEMY:
+            return {"win": False, "loss": False, "moved": False}
+        before = self.state()
+        cells = list()
+        if new_space == BOX or new_space == COMPLETED_BOX:
+            box = after + step
+            if board[box] != EMPTY and board[box] != GOAL:
+                return {"win": False, "loss": False, "moved": False}
+            if new_space == COMPLETED_BOX:
+                self.goals_left += 1
+            if self.floor[box] == GOAL:
+                self.put(cells, box, COMPLETED_BOX)
+                self.goals_left -= 1
+            else:
+                self.put(cells, box, BOX)
+        self.put(cells, self.player, self.floor[self.player])
+        self.put(cells, after, PLAYER)
+        self.player = after
+        self.move_enemies(cells)
+        self.moves_made += 1
+        letter = LETTERS[(step > 0) + 2 * (abs(step) != 1)]
+        self.journal.append((letter, cells, before, self.state()))
+        self.undone.clear()
+        self.history.append(letter)
+        self.mark(*[idx for idx, _, _ in cells])
+        return self.results(True)
+
+    def undo(self):
+        if not self.journal:
+            return {"win": False, "loss": False, "moved": False}
+        record = self.journal.pop()
+        letter, cells, before, _ = record
+        for idx, old, _ in reversed(cells):
+            self.board[idx] = old
+        self.restore(before)
+        self.undone.append(record)
+        del self.history[-1]
+        self.mark(*[idx for idx, _, _ in cells])
+        return self.results(True)
+
+    def redo(self):
+        if not self.undone:
+            return {"win": False, "loss": False, "moved": False}
+        record = self.undone.pop()
+        letter, cells, _, after = record
+        for idx, _, new in cells:
+            self.board[idx] = new
+        self.restore(after)
+        self.journal.append(record)
+        self.history.append(letter)
+        self.mark(*[idx for idx, _, _ in cells])
+        return self.results(True)
+
+    def random(self, n):
+        x = self.rng
+        x ^= (x << 13) & 0xFFFFFFFFFFFFFFFF
+        x ^= x >> 7
+        x ^= (x << 17) & 0xFFFFFFFFFFFFFFFF
+        self.rng = x
+        return x % n
+
+    def move_enemies(self, cells):
+        board = self.board
+        for idx, enemy in enumerate(self.enemies):
+            free = [enemy + step for step in self.routes[self.exits[enemy]]
+                    if board[enemy + step] == EMPTY or board[enemy + step] == GOAL]
+            if not free:
+                continue
+            if self.chase and self.random(100) < self.chase:
+                after = min(free, key=self.distance)
+            else:
+                after = free[self.random(len(free))]
+            self.put(cells, enemy, self.floor[enemy])
+            self.put(cells, after, ENEMY)
+            self.enemies[idx] = after
+
+    def distance(self, idx):
+        row, col = divmod(idx, self.stride)
+        player_row, player_col = divmod(self.player, self.stride)
+        return abs(row - player_row) + abs(col - player_col)
+
+    def mark(self, *cells):
+        if self.dirty is not None:
+            for idx in cells:
+                self.dirty.add(idx // self.stride - 1)
 
     def check_for_win(self):
-        for row in self.board:
-            for entry in row:
-                if entry == "goal":
-                    return False
-        for col in range(len(self.initial_board)):
-            for row in range(len(self.initial_board[col])):
-                if self.initial_board[col][row] == "goal":
-                    if self.board[col][row] == "player":
-                        return False
-        return True
+        return self.goals_left == 0
 
 
 class RandomBoard:
-    def __init__(self, width, height, boxes, level):
+    def __init__(self, width, height, boxes, level, rng=None):
+        self.rng = rng or random.Random()
         self.max_boxes = 12
         self.box_count = round(boxes * .51) if (round(boxes * .51) <= self.max_boxes) else self.max_boxes
         self.level = level
@@ -213,59 +483,197 @@ class RandomBoard:
     def place_boxes(self):
         for _ in range(self.box_count):
             for idx in range(2):
-                x = random.randint(0 + idx, self.height - idx - 1)
-                y = random.randint(0 + idx, self.width - idx - 1)
+                x = self.rng.randint(0 + idx, self.height - idx - 1)
+                y = self.rng.randint(0 + idx, self.width - idx - 1)
                 while self.board[x][y] != "empty":
-                    x = random.randint(0 + idx, self.height - idx - 1)
-                    y = random.randint(0 + idx, self.width - idx - 1)
+                    x = self.rng.randint(0 + idx, self.height - idx - 1)
+                    y = self.rng.randint(0 + idx, self.width - idx - 1)
                 self.board[x][y] = ("goal", "box")[idx]
 
     def place_player(self):
-        x = random.randint(1, self.height - 2)
-        y = random.randint(1, self.width - 2)
+        x = self.rng.randint(1, self.height - 2)
+        y = self.rng.randint(1, self.width - 2)
         while self.board[x][y] != "empty":
-            x = random.randint(1, self.height - 2)
-            y = random.randint(1, self.width - 2)
+            x = self.rng.randint(1, self.height - 2)
+            y = self.rng.randint(1, self.width - 2)
         self.board[x][y] = "player"
 
     def place_enemies(self):
         for _ in range(self.enemy_count):
-            x = random.randint(0, self.height - 1)
-            y = random.randint(0, self.width - 1)
+            x = self.rng.randint(0, self.height - 1)
+            y = self.rng.randint(0, self.width - 1)
             while self.board[x][y] != "empty":
-                x = random.randint(0, self.height - 1)
-                y = random.randint(0, self.width - 1)
+                x = self.rng.randint(0, self.height - 1)
+                y = self.rng.randint(0, self.width - 1)
             self.board[x][y] = "enemy"
 
 
+class ReverseBoard:
+    def __init__(self, width, height, boxes, level, walls=None, pulls=None, depth=None, rng=None):
+        self.rng = rng or random.Random()
+        self.max_boxes = 12
+        self.box_count = round(boxes * .51) if (round(boxes * .51) <= self.max_boxes) else self.max_boxes
+        self.level = level
+        self.enemy_count = 1 * ((int(self.level) >= 10) + (int(self.level) >= 100))
+        self.max_width = 16
+        self.max_height = 16
+        self.max_pulls = 200
+        self.width = min(round(width + (.15 * level)), self.max_width)
+        self.height = min(round(height + (.1 * level)), self.max_height)
+        self.wall_count = walls if walls is not None else min(level // 3, (self.width * self.height) // 8)
+        self.pulls = pulls if pulls is not None else min(3 * self.box_count + level // 2, self.max_pulls)
+        self.depth = depth if depth is not None else self.box_count
+        self.stride = self.width + 2
+        for _ in range(20):
+            if self.generate():
+                break
+        self.board = [[TILES[self.grid[(row + 1) * self.stride + col + 1]] for col in range(self.width)]
+                      for row in range(self.height)]
+
+    def generate(self):
+        stride = self.stride
+        grid = self.grid = bytearray([WALL]) * (stride * (self.height + 2))
+        cells = [(row + 1) * stride + col + 1 for row in range(self.height) for col in range(self.width)]
+        for idx in cells:
+            grid[idx] = EMPTY
+        for idx in self.rng.sample(cells, self.wall_count):
+            grid[idx] = WALL
+
+        player = self.rng.choice(cells)
+        grid[player] = PLAYER
+        region = [player]
+        for cell in region:
+            for step in (1, -1, stride, -stride):
+                if grid[cell + step] == EMPTY:
+                    grid[cell + step] = PLAYER
+                    region.append(cell + step)
+        if len(region) < 2 * self.box_count + 2:
+            return False
+        for idx in cells:
+            grid[idx] = EMPTY if grid[idx] == PLAYER else WALL
+        grid[player] = PLAYER
+
+        goals = set(self.rng.sample(region[1:], self.box_count))
+        for idx in goals:
+            grid[idx] = BOX
+        player = self.pull(grid, player, goals)
+        if player in goals or all(grid[idx] == BOX for idx in goals):
+            return False
+
+        for idx in region:
+            if grid[idx] == BOX and idx in goals:
+                grid[idx] = COMPLETED_BOX
+            elif grid[idx] == EMPTY and idx in goals:
+                grid[idx] = GOAL
+        enemies = 0
+        for idx in self.rng.sample(region, len(region)):
+            if enemies == self.enemy_count:
+                break
+            if grid[idx] == EMPTY:
+                grid[idx] = ENEMY
+                enemies += 1
+        return True
+
+    def pull(self, grid, player, goals):
+        steps = (1, -1, self.stride, -self.stride)
+        pulls = displaced = 0
+        budget = 40 * (self.pulls + 1)
+        while budget:
+            budget -= 1
+            step = self.rng.choice(steps)
+            ahead = player + step
+            if grid[ahead] != EMPTY:
+                continue
+            behind = player - step
+            grid[player] = EMPTY
+            if grid[behind] == BOX and self.rng.random() < .8 and pulls < self.pulls:
+                grid[behind] = EMPTY
+                grid[player] = BOX
+                pulls += 1
+                displaced += (behind in goals) - (player in goals)
+            player = ahead
+            grid[player] = PLAYER
+            if pulls >= self.pulls and displaced >= self.depth and player not in goals:
+                break
+        return player
+
+
+def random_board(level, seed):
+    return ReverseBoard(5, 5, level, level, rng=random.Random(seed)).board
+
+
+def seeded_board(level):
+    seed = random.getrandbits(32)
+    return seed, random_board(level, seed)
+
+
 class CustomBoard:
+    max_bytes = 16384
+    max_rows = 64
+    max_cols = 64
+
     def __init__(self, file=None, board=None, text=None):
         self.moves = None
         self.file = file
-        self.text = text if text is None else self.parse_text(text)
-        self.valid_tiles = ["player", "box", "empty", "goal", "wall", "enemy"]
+        self.text = text
+        self.valid_tiles = ["player", "box", "empty", "goal", "wall", "enemy", "completed_box", "goal_player"]
         if self.file:
-            self.content = self.parse_text(self.file.decode("utf-8"))
-            self.board_string = self.content
-            self.board = [[re.sub("\r", "", i) for i in k.split(" ")] for k in self.remove_args(self.content).split("\n")]
-        if self.text:
+            self.board_string = self.file.decode("utf-8")
+        elif self.text:
             self.board_string = self.text
-            self.board = [[re.sub("\r", "", i) for i in k.split(" ")] for k in self.remove_args(self.text).split("\n")]
-        elif board:
+        else:
             self.board_string = board
-            self.parse_text(board)
-            self.board = [[re.sub("\r", "", i) for i in k.split(" ")] for k in self.remove_args(board).split("\n")]
-
-    def parse_text(self, text):
-        moves_match = re.search(r"-?\s?\s?moves:\s?(\d+)\n?", text)
-        if moves_match:
-            self.moves = int(moves_match.group(1))
-        return text
-
-    @staticmethod
-    def remove_args(text):
-        text = re.sub(r"`+([A-z]+)?\n?", "", text)
-        return re.sub(r"(-\s?)?\s?moves:\s?(\d+)\n?", "", text)
+        if len(self.board_string) > self.max_bytes:
+            raise GameError(f"Level is too large, it must be under {self.max_bytes} characters.")
+        self.board = self.parse(self.board_string)
+
+    def parse(self, text):
+        valid = set(self.valid_tiles)
+        rows = list()
+        xsb = None
+        for line in text.replace("\r", "").split("\n"):
+            if line.startswith("`"):
+                line = FENCE_PATTERN.sub("", line)
+                if not line.strip():
+                    continue
+            line = line.rstrip("`")
+            moves_match = MOVES_PATTERN.fullmatch(line)
+            if moves_match:
+                self.moves = int(moves_match.group(1))
+                continue
+            if not line.strip():
+                continue
+            if xsb is None:
+                xsb = XSB_PATTERN.fullmatch(line) is not None
+            if xsb:
+                if not XSB_PATTERN.fullmatch(line):
+                    raise GameError("Level rows must use either tile names or standard Sokoban characters.")
+                for segment in line.split("|"):
+                    if not segment:
+                        continue
+                    row = list()
+                    for count, char in XSB_TOKEN.findall(segment):
+                        if len(count) > 3:
+                            raise GameError(f"Level rows can be at most {self.max_cols} tiles wide.")
+                        count = int(count) if count else 1
+                        if len(row) + count > self.max_cols:
+                            raise GameError(f"Level rows can be at most {self.max_cols} tiles wide.")
+                        row.extend([XSB_TILES[char]] * count)
+                    rows.append(row)
+            else:
+                row = [tile if tile in valid else "empty" for tile in line.split()]
+                if len(row) > self.max_cols:
+                    raise GameError(f"Level rows can be at most {self.max_cols} tiles wide.")
+                rows.append(row)
+            if len(rows) > self.max_rows:
+                raise GameError(f"Levels can be at most {self.max_rows} rows tall.")
+        if not rows:
+            raise GameError("No level was found in the message.")
+        if xsb:
+            width = max(len(row) for row in rows)
+            for row in rows:
+                row.extend(["empty"] * (width - len(row)))
+        return rows
 
     def check_for_validity(self):
         checks = {"box_to_goal": None, "no_boxes_or_goals": None, "player_error": None,
@@ -274,11 +682,11 @@ class CustomBoard:
         player = 0
         for col in self.board:
             for entry in col:
-                if entry == "box":
+                if entry == "box" or entry == "completed_box":
                     box_to_goal[0] += 1
-                if entry == "goal":
+                if entry == "goal" or entry == "completed_box" or entry == "goal_player":
                     box_to_goal[1] += 1
-                if entry == "player":
+                if entry == "player" or entry == "goal_player":
                     player += 1
         if box_to_goal[0] != box_to_goal[1]:
             checks["box_to_goal"] = f"Box amount [{box_to_goal[0]}] is not equal to goal amount [{box_to_goal[1]}], rendering level impossible."
@@ -296,15 +704,6 @@ class CustomBoard:
                 checks["box_corner"] = "A box is placed in a corner, rendering the level impossible"
         return checks
 
-    def remove_invalid_tiles(self):
-        for entry in self.board:
-            if entry == [""]:
-                self.board.remove(entry)
-        for col in range(len(self.board)):
-            for row in range(len(self.board[col])):
-                if self.board[col][row] not in self.valid_tiles:
-                    self.board[col][row] = "empty"
-
 
 class GameError(BaseException):
     def __init__(self, message):
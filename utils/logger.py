@@ -1,4 +1,7 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 
 
@@ -15,6 +18,12 @@ def setup_logger(name, debug):
         logging.Formatter('[%(asctime)s]: %(name)s - %(levelname)s - %(message)s')
     )
 
-    _logger.addHandler(stream_handler)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    _logger.addHandler(logging.handlers.QueueHandler(log_queue))
     _logger.setLevel(level)
+    _logger.listener = listener
     return _logger
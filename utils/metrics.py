@@ -0,0 +1,122 @@
+import os
+import time
+
+
+BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, float("inf"))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+
+    def quantile(self, fraction):
+        target = fraction * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target and total:
+                return bound
+        return 0.0
+
+    def samples(self, name, labels):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f"{name}_bucket", labels + (("le", "+Inf" if bound == float("inf") else repr(bound)),), total
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics:
+    def __init__(self, prefix="sokoban"):
+        self.prefix = prefix
+        self.metrics = dict()
+        self.help = dict()
+
+    def get(self, cls, name, help, labels):
+        name = f"{self.prefix}_{name}"
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = self.metrics[key] = cls()
+            self.help.setdefault(name, (cls.kind, help))
+        return metric
+
+    def counter(self, name, help="", **labels):
+        return self.get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", **labels):
+        return self.get(Gauge, name, help, labels)
+
+    def histogram(self, name, help="", **labels):
+        return self.get(Histogram, name, help, labels)
+
+    def time(self, name, help="", **labels):
+        return Timer(self.histogram(name, help, **labels))
+
+    def render(self):
+        lines = list()
+        described = set()
+        for (name, labels), metric in sorted(self.metrics.items(), key=lambda item: item[0]):
+            if name not in described:
+                kind, help = self.help[name]
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+            for sample, sample_labels, value in metric.samples(name, labels):
+                label_text = ",".join(f'{key}="{label}"' for key, label in sample_labels)
+                lines.append(f"{sample}{{{label_text}}} {value}" if label_text else f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, text=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp = f"{path}.tmp"
+        with open(temp, "w") as fp:
+            fp.write(text if text is not None else self.render())
+        os.replace(temp, path)
@@ -0,0 +1,97 @@
+import mmap
+import os
+import re
+
+from array import array
+from utils.game import XSB_PATTERN
+
+
+NAME_PATTERN = re.compile(r"[a-z0-9_\-]{1,32}")
+
+
+class PackError(BaseException):
+    def __init__(self, message):
+        self.message = message
+
+
+class PackLibrary:
+    def __init__(self, directory="config/packs"):
+        self.directory = directory
+        self.packs = dict()
+
+    def path(self, name, ext):
+        return os.path.join(self.directory, f"{name}.{ext}")
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return list()
+        return sorted(file[:-4] for file in os.listdir(self.directory) if file.endswith(".idx"))
+
+    def import_pack(self, name, data):
+        if not NAME_PATTERN.fullmatch(name):
+            raise PackError("Pack names may only use lowercase letters, numbers, - and _ (32 at most)")
+        os.makedirs(self.directory, exist_ok=True)
+        index = array("Q", [0])
+        offset = 0
+        rows = list()
+        with open(self.path(name, "lvl.tmp"), "wb") as fp:
+            for line in data.decode("utf-8", errors="replace").replace("\r", "").split("\n"):
+                line = line.rstrip()
+                if line and "#" in line and XSB_PATTERN.fullmatch(line):
+                    rows.append(line)
+                    continue
+                if rows:
+                    level = ("\n".join(rows) + "\n").encode("utf-8")
+                    fp.write(level)
+                    offset += len(level)
+                    index.append(offset)
+                    rows = list()
+            if rows:
+                level = ("\n".join(rows) + "\n").encode("utf-8")
+                fp.write(level)
+                offset += len(level)
+                index.append(offset)
+            fp.flush()
+            os.fsync(fp.fileno())
+        if len(index) == 1:
+            os.remove(self.path(name, "lvl.tmp"))
+            raise PackError("No levels were found in that file")
+        with open(self.path(name, "idx.tmp"), "wb") as fp:
+            index.tofile(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        return len(index) - 1
+
+    def install(self, name):
+        self.close(name)
+        os.replace(self.path(name, "lvl.tmp"), self.path(name, "lvl"))
+        os.replace(self.path(name, "idx.tmp"), self.path(name, "idx"))
+
+    def open(self, name):
+        pack = self.packs.get(name)
+        if pack is None:
+            if not NAME_PATTERN.fullmatch(name) or not os.path.exists(self.path(name, "idx")):
+                raise PackError(f"Cannot find level pack {name}")
+            with open(self.path(name, "lvl"), "rb") as fp:
+                levels = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            with open(self.path(name, "idx"), "rb") as fp:
+                index = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            pack = self.packs[name] = (levels, index, memoryview(index).cast("Q"))
+        return pack
+
+    def count(self, name):
+        return len(self.open(name)[2]) - 1
+
+    def get(self, name, number):
+        levels, _, index = self.open(name)
+        if not 1 <= number < len(index):
+            raise PackError(f"Level pack {name} only has levels 1 to {len(index) - 1}")
+        return levels[index[number - 1]:index[number]].decode("utf-8")
+
+    def close(self, name):
+        pack = self.packs.pop(name, None)
+        if pack is not None:
+            levels, index, view = pack
+            view.release()
+            levels.close()
+            index.close()
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+from collections import OrderedDict, deque
+
+
+class LevelPool:
+    def __init__(self, factory, depth=4, max_levels=32, executor=None, logger=None):
+        self.factory = factory
+        self.logger = logger or logging.getLogger(__name__)
+        self.executor = executor
+        self.depth = depth
+        self.max_levels = max_levels
+        self.pools = OrderedDict()
+        self.wanted = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.event = None
+        self.task = None
+
+    def start(self, loop, warm=(1,)):
+        self.event = asyncio.Event()
+        self.task = loop.create_task(self.worker())
+        for level in warm:
+            self.request(level)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def pop(self, level):
+        pool = self.pools.get(level)
+        if pool:
+            self.hits += 1
+            board = pool.popleft()
+        else:
+            self.misses += 1
+            board = None
+        self.request(level)
+        self.request(level + 1)
+        return board
+
+    def request(self, level):
+        pool = self.pools.get(level)
+        if pool is not None:
+            self.pools.move_to_end(level)
+            if len(pool) >= self.depth:
+                return
+        self.wanted[level] = None
+        if self.event is not None:
+            self.event.set()
+
+    async def worker(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self.event.wait()
+            self.event.clear()
+            while self.wanted:
+                level, _ = self.wanted.popitem(last=False)
+                pool = self.pools.get(level)
+                if pool is None:
+                    pool = self.pools[level] = deque(maxlen=self.depth)
+                    while len(self.pools) > self.max_levels:
+                        self.pools.popitem(last=False)
+                while len(pool) < self.depth:
+                    try:
+                        if self.executor is not None:
+                            board = await self.executor.run(self.factory, level)
+                        else:
+                            board = await loop.run_in_executor(None, self.factory, level)
+                    except asyncio.TimeoutError:
+                        break
+                    except Exception as e:
+                        self.logger.error(f"Could not generate boards for level {level}: {e!r}")
+                        self.pools.pop(level, None)
+                        break
+                    pool.append(board)
+                    self.generated += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "generated": self.generated,
+                "levels": len(self.pools), "ready": sum(len(pool) for pool in self.pools.values())}
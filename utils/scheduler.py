@@ -0,0 +1,62 @@
+import asyncio
+import discord
+import time
+
+
+class EditScheduler:
+    def __init__(self, window=1.0, max_outstanding=20, metrics=None):
+        self.window = window
+        self.metrics = metrics
+        self.semaphore = asyncio.Semaphore(max_outstanding)
+        self.pending = dict()
+        self.workers = dict()
+        self.requested = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def schedule(self, message, render):
+        self.requested += 1
+        if message.id in self.pending:
+            self.coalesced += 1
+        self.pending[message.id] = (message, render)
+        if message.id not in self.workers:
+            self.workers[message.id] = asyncio.ensure_future(self.worker(message.id))
+
+    def discard(self, message_id):
+        if self.pending.pop(message_id, None) is not None:
+            self.coalesced += 1
+
+    async def flush(self, message):
+        await self.send(message.id)
+
+    async def worker(self, message_id):
+        try:
+            while message_id in self.pending:
+                await self.send(message_id)
+                await asyncio.sleep(self.window)
+        finally:
+            self.workers.pop(message_id, None)
+
+    async def send(self, message_id):
+        item = self.pending.pop(message_id, None)
+        if item is None:
+            return
+        message, render = item
+        kwargs = render()
+        if kwargs is None:
+            return
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                await message.edit(**kwargs)
+                self.sent += 1
+            except discord.HTTPException:
+                self.failed += 1
+            if self.metrics is not None:
+                self.metrics.histogram("api_seconds", "Time spent waiting on Discord API calls",
+                                       call="edit").observe(time.perf_counter() - start)
+
+    def stats(self):
+        return {"requested": self.requested, "sent": self.sent, "saved": self.coalesced,
+                "failed": self.failed, "pending": len(self.pending)}
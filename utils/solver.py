@@ -0,0 +1,252 @@
+import hashlib
+import heapq
+import random
+import struct
+import time
+
+from collections import OrderedDict
+
+
+MAX_NODES = 20000
+TIME_LIMIT = 0.5
+INFINITY = 1 << 30
+CACHE_SIZE = 4096
+SEARCHES = 4
+
+_zobrist = random.Random(0x50C0BA)
+_searches = OrderedDict()
+
+
+def directions(stride):
+    return {1: "R", -1: "L", stride: "D", -stride: "U"}
+
+
+def region(walls, boxes, player, stride):
+    seen = bytearray(len(walls))
+    seen[player] = 1
+    queue = [player]
+    normal = player
+    steps = (1, -1, stride, -stride)
+    for cell in queue:
+        if cell < normal:
+            normal = cell
+        for step in steps:
+            after = cell + step
+            if not seen[after] and not walls[after] and after not in boxes:
+                seen[after] = 1
+                queue.append(after)
+    return seen, normal
+
+
+def walk(walls, boxes, start, end, stride):
+    steps = directions(stride)
+    parents = {start: None}
+    queue = [start]
+    for cell in queue:
+        if cell == end:
+            break
+        for step in steps:
+            after = cell + step
+            if after not in parents and not walls[after] and after not in boxes:
+                parents[after] = step
+                queue.append(after)
+    moves = list()
+    cell = end
+    while parents[cell] is not None:
+        moves.append(steps[parents[cell]])
+        cell -= parents[cell]
+    return "".join(reversed(moves))
+
+
+class Zobrist:
+    def __init__(self, size):
+        self.boxes = [_zobrist.getrandbits(64) for _ in range(size)]
+        self.player = [_zobrist.getrandbits(64) for _ in range(size)]
+
+    def hash(self, boxes, player):
+        value = self.player[player]
+        for box in boxes:
+            value ^= self.boxes[box]
+        return value
+
+
+class Solver:
+    def __init__(self, walls, goals, boxes, player, stride):
+        self.walls = walls
+        self.goals = frozenset(goals)
+        self.stride = stride
+        self.steps = directions(stride)
+        self.size = len(walls)
+        self.zobrist = Zobrist(self.size)
+        self.distance = self.goal_distances()
+
+        boxes = frozenset(boxes)
+        reach, normal = self.reach(boxes, player)
+        key = self.zobrist.hash(boxes, normal)
+        self.nodes = [(boxes, player, None, None)]
+        self.table = {key: 0}
+        self.open = [(self.heuristic(boxes), 0, 0)]
+        self.expanded = 0
+        self.status = "unknown"
+        self.solution = None
+        self.pushes = None
+        if len(boxes) != len(self.goals) or any(self.distance[box] == INFINITY for box in boxes):
+            self.status = "invalid"
+            self.open = list()
+
+    def goal_distances(self):
+        distance = [INFINITY] * self.size
+        queue = list(self.goals)
+        for goal in queue:
+            distance[goal] = 0
+        for cell in queue:
+            for step in self.steps:
+                before = cell - step
+                if not self.walls[before] and not self.walls[before - step] and distance[before] == INFINITY:
+                    distance[before] = distance[cell] + 1
+                    queue.append(before)
+        return distance
+
+    def heuristic(self, boxes):
+        return sum(self.distance[box] for box in boxes)
+
+    def reach(self, boxes, player):
+        return region(self.walls, boxes, player, self.stride)
+
+    def frozen(self, boxes, box, seen):
+        seen.add(box)
+        return self.blocked(boxes, box, 1, seen) and self.blocked(boxes, box, self.stride, seen)
+
+    def blocked(self, boxes, box, step, seen):
+        before, after = box - step, box + step
+        if self.walls[before] or self.walls[after]:
+            return True
+        if self.distance[before] == INFINITY and self.distance[after] == INFINITY:
+            return True
+        for cell in (before, after):
+            if cell in seen:
+                return True
+            if cell in boxes and self.frozen(boxes, cell, seen):
+                return True
+        return False
+
+    def deadlocked(self, boxes, box):
+        return box not in self.goals and self.frozen(boxes, box, set())
+
+    def run(self, max_nodes=MAX_NODES, time_limit=TIME_LIMIT):
+        deadline = time.perf_counter() + time_limit
+        budget = self.expanded + max_nodes
+        while self.open and self.status == "unknown":
+            if self.expanded >= budget or time.perf_counter() > deadline:
+                break
+            _, cost, node = heapq.heappop(self.open)
+            boxes, player, _, _ = self.nodes[node]
+            if boxes == self.goals:
+                self.status = "solved"
+                self.solution = self.path(node)
+                break
+            self.expanded += 1
+            reach, _ = self.reach(boxes, player)
+            for box in boxes:
+                for step in self.steps:
+                    after = box + step
+                    if not reach[box - step] or self.walls[after] or after in boxes:
+                        continue
+                    if self.distance[after] == INFINITY:
+                        continue
+                    pushed = (boxes - {box}) | {after}
+                    if self.deadlocked(pushed, after):
+                        continue
+                    _, normal = self.reach(pushed, box)
+                    key = self.zobrist.hash(pushed, normal)
+                    if self.table.get(key, INFINITY) <= cost + 1:
+                        continue
+                    self.table[key] = cost + 1
+                    self.nodes.append((pushed, box, node, (box, step)))
+                    heapq.heappush(self.open, (cost + 1 + self.heuristic(pushed), cost + 1, len(self.nodes) - 1))
+        if not self.open and self.status == "unknown":
+            self.status = "invalid"
+        return {"status": self.status, "solution": self.solution, "pushes": self.pushes, "nodes": self.expanded}
+
+    def path(self, node):
+        pushes = list()
+        while self.nodes[node][2] is not None:
+            boxes, _, parent, push = self.nodes[node]
+            pushes.append((self.nodes[parent][0], push))
+            node = parent
+        pushes.reverse()
+        self.pushes = [push for _, push in pushes]
+        moves = list()
+        player = self.nodes[0][1]
+        for boxes, (box, step) in pushes:
+            moves.append(walk(self.walls, boxes, player, box - step, self.stride))
+            moves.append(self.steps[step])
+            player = box
+        return "".join(moves)
+
+
+def solve(walls, goals, boxes, player, stride, max_nodes=MAX_NODES, time_limit=TIME_LIMIT):
+    return Solver(walls, goals, boxes, player, stride).run(max_nodes, time_limit)
+
+
+def search(walls, goals, boxes, player, stride, max_nodes=MAX_NODES, time_limit=TIME_LIMIT):
+    key = (walls, tuple(sorted(goals)), frozenset(boxes), region(walls, boxes, player, stride)[1])
+    solver = _searches.pop(key, None) or Solver(walls, goals, boxes, player, stride)
+    result = solver.run(max_nodes, time_limit)
+    if result["status"] == "unknown":
+        _searches[key] = solver
+        while len(_searches) > SEARCHES:
+            _searches.popitem(last=False)
+    return result
+
+
+class SolutionCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, walls, goals, boxes, player, stride, static=None):
+        if static is None:
+            goals = sorted(goals)
+            static = hashlib.blake2b(walls + struct.pack(f"<{len(goals)}I", *goals), digest_size=16).digest()
+        return static, frozenset(boxes), region(walls, boxes, player, stride)[1]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def add(self, walls, goals, boxes, player, stride, result):
+        key = self.key(walls, goals, boxes, player, stride)
+        if result["status"] == "invalid":
+            self.put(key, None)
+        if result["status"] != "solved":
+            return
+        pushes = tuple(result["pushes"])
+        boxes = set(boxes)
+        for idx, (box, step) in enumerate(pushes):
+            self.put(self.key(walls, goals, boxes, player, stride, static=key[0]), (pushes, idx))
+            boxes.remove(box)
+            boxes.add(box + step)
+            player = box
+
+    def lookup(self, walls, goals, boxes, player, stride):
+        key = self.key(walls, goals, boxes, player, stride)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        entry = self.entries[key]
+        if entry is None:
+            return {"status": "invalid"}
+        pushes, idx = entry
+        box, step = pushes[idx]
+        moves = walk(walls, set(boxes), player, box - step, stride) + directions(stride)[step]
+        return {"status": "solved", "moves": moves, "pushes": len(pushes) - idx}
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
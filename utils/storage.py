@@ -0,0 +1,87 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LevelStore:
+    def __init__(self, path="config/levels.db", legacy="config/levels.json", logger=None):
+        self.path = path
+        self.legacy = legacy
+        self.logger = logger or logging.getLogger(__name__)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-store")
+        self.connection = None
+        self.pending = dict()
+        self.writes = 0
+        self.skipped = 0
+
+    def connect(self):
+        if self.connection is not None:
+            return self.connection
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        connection.execute("CREATE TABLE IF NOT EXISTS levels (user_id INTEGER PRIMARY KEY, board TEXT NOT NULL)")
+        self.connection = connection
+        empty = connection.execute("SELECT 1 FROM levels LIMIT 1").fetchone() is None
+        if empty and self.legacy and os.path.exists(self.legacy):
+            with open(self.legacy, "r") as fp:
+                self.write({int(user_id): board for user_id, board in json.load(fp).items()})
+        return connection
+
+    def read(self, user_id):
+        row = self.connect().execute("SELECT board FROM levels WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def write(self, batch):
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO levels (user_id, board) VALUES (?, ?)", batch.items())
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    async def run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    async def open(self):
+        await self.run(self.connect)
+
+    async def get(self, user_id):
+        if user_id in self.pending:
+            return self.pending[user_id]
+        return await self.run(self.read, user_id)
+
+    def put(self, user_id, board):
+        self.pending[user_id] = board
+        asyncio.ensure_future(self.flush()).add_done_callback(self.flushed)
+
+    def flushed(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"Could not save custom levels: {task.exception()}")
+
+    async def flush(self):
+        if not self.pending:
+            self.skipped += 1
+            return False
+        batch, self.pending = self.pending, dict()
+        try:
+            await self.run(self.write, batch)
+        except sqlite3.Error:
+            for user_id, board in batch.items():
+                self.pending.setdefault(user_id, board)
+            raise
+        self.writes += 1
+        return True
+
+    async def close(self):
+        await self.flush()
+        if self.connection is not None:
+            await self.run(self.connection.close)
+            self.connection = None
@@ -0,0 +1,61 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+
+class LoopWatchdog:
+    def __init__(self, loop, logger, threshold=0.25, interval=0.05):
+        self.loop = loop
+        self.logger = logger
+        self.threshold = threshold
+        self.interval = interval
+        self.heartbeat = time.monotonic()
+        self.loop_thread = None
+        self.stalls = 0
+        self.longest = 0.0
+        self.task = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.task = self.loop.create_task(self.beat())
+        self.thread = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+
+    async def beat(self):
+        self.loop_thread = threading.get_ident()
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def watch(self):
+        reported = None
+        while not self.stopped.wait(self.interval):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat
+            if stalled > self.threshold and reported != heartbeat and self.loop_thread is not None:
+                reported = heartbeat
+                self.stalls += 1
+                self.report(stalled)
+            elif reported is not None and reported != heartbeat:
+                stalled = heartbeat - reported
+                self.longest = max(self.longest, stalled)
+                self.logger.warning(f"Event loop recovered after a {stalled:.3f}s stall")
+                reported = None
+
+    def report(self, stalled):
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        frame = sys._current_frames().get(self.loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable\n"
+        coro = task.get_coro() if task is not None else None
+        self.logger.warning(f"Event loop stalled for over {stalled:.3f}s while running {coro!r}\n{stack.rstrip()}")